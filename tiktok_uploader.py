@@ -1,41 +1,174 @@
 import os
+import sys
 import time
-import json
-from datetime import datetime
+import queue
+import random
+import re
+import ssl
+import threading
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import subprocess
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.exceptions import TransportError
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, build_http
 import pickle
+import httplib2
+import orjson
+
+logger = logging.getLogger(__name__)
 
 # Configuration
 TIKTOK_USERNAME = os.getenv('TIKTOK_USERNAME', 'your_tiktok_username')
-UPLOAD_HISTORY_FILE = "uploaded_videos.json"
+UPLOAD_HISTORY_FILE = "uploaded_videos.json"  # Legacy history, migrated on first run
+UPLOAD_LOG_FILE = "uploaded.ndjson"  # Append-only log of uploaded video IDs
+STATE_FILE = "state.json"  # Current position in the video list
+VIDEO_LIST_CACHE = "video_list.json"  # Cached TikTok video listing
+VIDEO_LIST_TTL = timedelta(hours=24)  # How long the cached listing stays fresh
+LISTING_WINDOW = 30  # Newest videos fetched when topping up an expired listing
+VIDEO_LIST_FULL_TTL = timedelta(days=7)  # Full re-scrape interval, drops videos deleted from TikTok
+REFRESH_VIDEO_LIST = os.getenv('REFRESH_VIDEO_LIST', '') == '1'  # Force a full re-scrape this run
 CREDENTIALS_FILE = "credentials.json"  # YouTube API credentials
 TOKEN_FILE = "token.pickle"
 VIDEOS_DIR = "tiktok_videos"  # Directory to store downloaded videos
+DOWNLOAD_QUEUE_SIZE = 2  # Max downloaded videos waiting for upload
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '4'))  # Parallel TikTok downloads
+UPLOAD_CHUNKSIZE = 100 * 1024 * 1024  # Resumable upload chunk size (multiple of 256 KiB)
+MAX_UPLOAD_RETRIES = 5  # Retries per chunk on transient errors
+HTTP_TIMEOUT = 300  # Socket timeout in seconds for YouTube API connections
+MAX_VIDEO_SIZE = 256 * 1024 ** 3  # YouTube's upload size limit (256 GB)
+MAX_VIDEO_DURATION = int(os.getenv('MAX_VIDEO_DURATION', 15 * 60))  # Seconds; 15 min for unverified accounts
+FFPROBE_TIMEOUT = 60  # Seconds before a stuck ffprobe is abandoned
+MAX_VIDEO_FAILURES = 3  # Failed attempts before a video is skipped for good
+
+# Errors worth retrying during a resumable upload
+RETRIABLE_STATUS_CODES = (500, 502, 503, 504)
+RETRIABLE_EXCEPTIONS = (ssl.SSLError, ConnectionError, TimeoutError)
+
+# yt-dlp options shared by every download in a run
+DOWNLOAD_OPTS = {
+    'outtmpl': os.path.join(VIDEOS_DIR, 'tiktok_%(id)s.mp4'),
+    'format': 'best',
+    'concurrent_fragment_downloads': 4,  # Parallel fragments for segmented formats
+    # 'impersonate': 'chrome',  # Impersonate Chrome browser
+    'quiet': False,
+    'no_warnings': False,
+}
 
-# YouTube API scopes
-SCOPES = ['https://www.googleapis.com/auth/youtube.upload']
+# YouTube API scopes (readonly is used to reconcile history with the channel)
+SCOPES = [
+    'https://www.googleapis.com/auth/youtube.upload',
+    'https://www.googleapis.com/auth/youtube.readonly'
+]
+
+# Tag embedded in YouTube descriptions to map uploads back to TikTok videos
+TIKTOK_ID_TAG = "[tiktok_id: {}]"
+TIKTOK_ID_PATTERN = re.compile(r"\[tiktok_id: (\w+)\]")
+VIDEO_FILE_PATTERN = re.compile(r"tiktok_(\w+)\.mp4")
 
 def setup_directories():
     """Create necessary directories"""
     if not os.path.exists(VIDEOS_DIR):
         os.makedirs(VIDEOS_DIR)
 
+def cleanup_uploaded_videos(uploaded_ids):
+    """
+    Delete downloaded files of videos that are already uploaded
+    Returns the names of the files left in VIDEOS_DIR
+    """
+    existing_files = set()
+    for entry in os.scandir(VIDEOS_DIR):
+        match = VIDEO_FILE_PATTERN.fullmatch(entry.name)
+        if match and match.group(1) in uploaded_ids:
+            os.remove(entry.path)
+        else:
+            existing_files.add(entry.name)
+    return existing_files
+
+def migrate_legacy_history():
+    """Convert the old single-JSON history into the append-only log and state file"""
+    with open(UPLOAD_HISTORY_FILE, 'rb') as f:
+        legacy = orjson.loads(f.read())
+    logger.info(f"Migrating {UPLOAD_HISTORY_FILE} to {UPLOAD_LOG_FILE} and {STATE_FILE}...")
+    migrated_at = datetime.now().isoformat()
+    with open(UPLOAD_LOG_FILE, 'ab') as f:
+        for video_id in legacy.get('uploaded_ids', []):
+            f.write(orjson.dumps({"id": video_id, "ts": migrated_at}) + b"\n")
+    save_uploaded_history({"current_index": legacy.get('current_index', 0)})
+
 def load_uploaded_history():
     """Load history of already uploaded videos"""
-    if os.path.exists(UPLOAD_HISTORY_FILE):
-        with open(UPLOAD_HISTORY_FILE, 'r') as f:
-            return json.load(f)
-    return {"uploaded_ids": [], "current_index": 0}
+    if not os.path.exists(UPLOAD_LOG_FILE) and os.path.exists(UPLOAD_HISTORY_FILE):
+        migrate_legacy_history()
+    
+    uploaded_ids = set()
+    if os.path.exists(UPLOAD_LOG_FILE):
+        with open(UPLOAD_LOG_FILE, 'rb') as f:
+            for line in f:
+                try:
+                    uploaded_ids.add(orjson.loads(line)['id'])
+                except (ValueError, KeyError):
+                    # Blank or truncated line from an interrupted write
+                    continue
+    
+    state = {}
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE, 'rb') as f:
+            state = orjson.loads(f.read())
+    
+    return {
+        "uploaded_ids": uploaded_ids,
+        "current_index": state.get('current_index', 0),
+        "last_id": state.get('last_id'),
+        "failures": state.get('failures', {})
+    }
+
+def append_uploaded(video_id):
+    """Record one uploaded video at the end of the upload log"""
+    with open(UPLOAD_LOG_FILE, 'ab') as f:
+        f.write(orjson.dumps({"id": video_id, "ts": datetime.now().isoformat()}) + b"\n")
 
 def save_uploaded_history(history):
-    """Save history of uploaded videos"""
-    with open(UPLOAD_HISTORY_FILE, 'w') as f:
-        json.dump(history, f, indent=2)
+    """Save the current position in the video list and per-video failure counts"""
+    with open(STATE_FILE, 'wb') as f:
+        f.write(orjson.dumps({
+            "current_index": history['current_index'],
+            "last_id": history.get('last_id'),
+            "failures": history.get('failures', {})
+        }))
+
+def record_failure(history, video_id):
+    """Count a failed attempt at a video. Returns True once it has failed MAX_VIDEO_FAILURES times"""
+    failures = history['failures']
+    failures[video_id] = failures.get(video_id, 0) + 1
+    return failures[video_id] >= MAX_VIDEO_FAILURES
+
+def load_video_list_cache():
+    """Load the cached TikTok video listing, or None if missing or for another user"""
+    if not os.path.exists(VIDEO_LIST_CACHE):
+        return None
+    with open(VIDEO_LIST_CACHE, 'rb') as f:
+        cache = orjson.loads(f.read())
+    if cache.get('username') != TIKTOK_USERNAME:
+        return None
+    return cache
+
+def save_video_list_cache(videos, full_fetched_at):
+    """Save the TikTok video listing with the time it was fetched and last fully scraped"""
+    with open(VIDEO_LIST_CACHE, 'wb') as f:
+        f.write(orjson.dumps({
+            'username': TIKTOK_USERNAME,
+            'fetched_at': datetime.now().isoformat(),
+            'full_fetched_at': full_fetched_at,
+            'videos': videos
+        }))
 
 def get_youtube_service():
     """Authenticate and return YouTube service"""
@@ -59,86 +192,269 @@ def get_youtube_service():
         with open(TOKEN_FILE, 'wb') as token:
             pickle.dump(creds, token)
     
-    return build('youtube', 'v3', credentials=creds)
+    # build_http() drops 308 from the redirect codes, which resumable uploads rely on
+    http = build_http()
+    http.timeout = HTTP_TIMEOUT
+    return build('youtube', 'v3', http=AuthorizedHttp(creds, http=http))
 
-def get_all_tiktok_videos():
+def fetch_tiktok_listing(playlistend=None):
     """
-    Fetch ALL videos from the TikTok account in chronological order (oldest first)
-    Using yt-dlp Python module
+    Flat-extract the TikTok channel listing in chronological order (oldest first)
+    playlistend=N: Only fetch the N newest videos
     """
-    print(f"Fetching all videos from @{TIKTOK_USERNAME}...")
+    import yt_dlp
     
     tiktok_url = f"https://www.tiktok.com/@{TIKTOK_USERNAME}"
     
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': True,
+    }
+    if playlistend:
+        # TikTok lists newest first, so this stops paging after N videos
+        ydl_opts['playlistend'] = playlistend
+    
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(tiktok_url, download=False)
+        
+        # Iterate newest-first entries in reverse to get oldest first
+        return [
+            {
+                'id': entry.get('id', 'unknown'),
+                'title': entry.get('title', 'TikTok Video'),
+                'url': entry.get('url') or entry.get('webpage_url') or f"https://www.tiktok.com/@{TIKTOK_USERNAME}/video/{entry.get('id')}"
+            }
+            for entry in reversed(info.get('entries') or [])
+        ]
+
+def fetch_new_tiktok_videos(cached_videos):
+    """
+    Fetch only the newest LISTING_WINDOW videos and append unseen ones to the cached listing
+    Returns None if there may be more new videos than the window covers
+    """
+    logger.info(f"Checking @{TIKTOK_USERNAME} for new videos...")
+    
+    newest = fetch_tiktok_listing(playlistend=LISTING_WINDOW)
+    known_ids = {video['id'] for video in cached_videos}
+    
+    # The oldest video in a full window must already be cached, otherwise we may have a gap
+    if len(newest) >= LISTING_WINDOW and newest[0]['id'] not in known_ids:
+        return None
+    
+    new_videos = [video for video in newest if video['id'] not in known_ids]
+    logger.info(f"Found {len(new_videos)} new videos")
+    return cached_videos + new_videos
+
+def get_all_tiktok_videos(current_index=0, refresh=False):
+    """
+    Fetch ALL videos from the TikTok account in chronological order (oldest first)
+    Using yt-dlp Python module
+
+    The listing is cached for VIDEO_LIST_TTL and re-fetched early when
+    refresh=True or once current_index reaches the end of the cached list.
+    An expired cache is topped up with only the newest videos when possible,
+    and fully re-scraped every VIDEO_LIST_FULL_TTL so deleted videos drop out.
+    """
+    cache = None if refresh else load_video_list_cache()
+    if cache:
+        age = datetime.now() - datetime.fromisoformat(cache['fetched_at'])
+        if age < VIDEO_LIST_TTL and current_index < len(cache['videos']):
+            logger.info(f"Using cached video list ({len(cache['videos'])} videos, fetched {cache['fetched_at']})")
+            return cache['videos']
+        
+        full_fetched_at = cache.get('full_fetched_at', cache['fetched_at'])
+        if datetime.now() - datetime.fromisoformat(full_fetched_at) >= VIDEO_LIST_FULL_TTL:
+            cache = None
+    
     try:
-        import yt_dlp
+        videos = fetch_new_tiktok_videos(cache['videos']) if cache else None
         
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': True,
-        }
+        if videos is None:
+            logger.info(f"Fetching all videos from @{TIKTOK_USERNAME}...")
+            videos = fetch_tiktok_listing()
+            full_fetched_at = datetime.now().isoformat()
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(tiktok_url, download=False)
-            
-            videos = []
-            if 'entries' in info:
-                for entry in info['entries']:
-                    videos.append({
-                        'id': entry.get('id', 'unknown'),
-                        'title': entry.get('title', 'TikTok Video'),
-                        'url': entry.get('url') or entry.get('webpage_url') or f"https://www.tiktok.com/@{TIKTOK_USERNAME}/video/{entry.get('id')}"
-                    })
-            
-            # Reverse to get oldest first
-            videos.reverse()
-            
-            print(f"Found {len(videos)} videos total")
-            return videos
+        logger.info(f"Found {len(videos)} videos total")
+        if videos:
+            save_video_list_cache(videos, full_fetched_at)
+        return videos
         
     except Exception as e:
-        print(f"Error fetching videos: {e}")
-        print("\nMake sure yt-dlp is installed: pip install yt-dlp")
+        logger.error(f"Error fetching videos: {e}")
+        logger.error("Make sure yt-dlp is installed: pip install yt-dlp")
         return []
 
-def download_tiktok_video(video_info):
-    """Download TikTok video using yt-dlp Python module with browser impersonation"""
+def download_tiktok_video(ydl, video_info, existing_files):
+    """
+    Download TikTok video using a shared yt-dlp YoutubeDL instance
+    existing_files: Names of files already in VIDEOS_DIR
+    """
     video_id = video_info['id']
-    output_file = os.path.join(VIDEOS_DIR, f"tiktok_{video_id}.mp4")
+    file_name = f"tiktok_{video_id}.mp4"
+    output_file = os.path.join(VIDEOS_DIR, file_name)
     
     # Check if already downloaded
-    if os.path.exists(output_file):
-        print(f"Video already downloaded: {output_file}")
+    if file_name in existing_files:
+        logger.info(f"Video already downloaded: {output_file}")
         return output_file
     
-    print(f"Downloading video {video_id}...")
+    logger.info(f"Downloading video {video_id}...")
     
     try:
-        import yt_dlp
+        ydl.download([video_info['url']])
         
-        ydl_opts = {
-            'outtmpl': output_file,
-            'format': 'best',
-            # 'impersonate': 'chrome',  # Impersonate Chrome browser
-            'quiet': False,
-            'no_warnings': False,
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([video_info['url']])
+        # The output name comes from yt-dlp's id, which can differ from the listing's
+        if not os.path.exists(output_file):
+            logger.error(f"Download finished but {output_file} was not created")
+            return None
         
-        print(f"Downloaded: {output_file}")
+        logger.info(f"Downloaded: {output_file}")
         return output_file
     except Exception as e:
-        print(f"Error downloading video: {e}")
-        print("\nTip: Make sure curl-cffi is installed:")
-        print("pip install 'yt-dlp[curl-cffi]'")
+        logger.error(f"Error downloading video: {e}")
+        logger.error("Tip: Make sure curl-cffi is installed:")
+        logger.error("pip install 'yt-dlp[curl-cffi]'")
         return None
 
-def upload_to_youtube(youtube, video_file, title, description):
+def download_batch(videos, existing_files, workers=DOWNLOAD_WORKERS):
+    """
+    Download videos concurrently, yielding (video_info, path) pairs
+    in the original order so uploads stay oldest first
+    """
+    import yt_dlp
+    
+    # YoutubeDL isn't thread-safe, so each worker reuses its own instance
+    # (extractors, cookies and connections) for all of its downloads
+    thread_state = threading.local()
+    downloaders = []
+    
+    def download(video_info):
+        if not hasattr(thread_state, 'ydl'):
+            # YoutubeDL keeps and mutates its params dict, so give each instance a copy
+            thread_state.ydl = yt_dlp.YoutubeDL(dict(DOWNLOAD_OPTS))
+            downloaders.append(thread_state.ydl)
+        return download_tiktok_video(thread_state.ydl, video_info, existing_files)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            try:
+                for video_info in videos:
+                    pending.append((video_info, executor.submit(download, video_info)))
+                    # Keep at most `workers` downloads ahead of the uploader
+                    if len(pending) >= workers:
+                        done_info, future = pending.popleft()
+                        yield done_info, future.result()
+                
+                while pending:
+                    done_info, future = pending.popleft()
+                    yield done_info, future.result()
+            finally:
+                # Don't start queued downloads if the batch is abandoned early
+                for _, future in pending:
+                    future.cancel()
+    finally:
+        for ydl in downloaders:
+            ydl.close()
+
+def put_until_stopped(ready_queue, item, stop_event):
+    """Put an item on the queue, giving up once the uploader has stopped. Returns True if queued"""
+    while not stop_event.is_set():
+        try:
+            ready_queue.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def download_producer(videos, existing_files, ready_queue, stop_event):
+    """Download videos in order and hand them to the uploader through the queue"""
+    batch = download_batch(videos, existing_files)
+    try:
+        for item in batch:
+            if not put_until_stopped(ready_queue, item, stop_event):
+                break
+    except Exception as e:
+        logger.error(f"Error downloading videos: {e}")
+        logger.error("Make sure yt-dlp is installed: pip install 'yt-dlp[curl-cffi]'")
+    finally:
+        batch.close()
+        # Sentinel: no more videos are coming
+        put_until_stopped(ready_queue, None, stop_event)
+
+def validate_video_file(video_file):
+    """
+    Check the file locally before spending bandwidth on an upload YouTube would reject
+    Returns (reason, permanent): reason is None if the video can be uploaded,
+    permanent is True if the video itself is over a limit rather than a bad download
+    """
+    size = os.path.getsize(video_file)
+    if size == 0:
+        return "file is empty", False
+    if size > MAX_VIDEO_SIZE:
+        return f"file is {size} bytes, over YouTube's {MAX_VIDEO_SIZE} byte limit", True
+    
+    try:
+        probe = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', video_file],
+            capture_output=True,
+            timeout=FFPROBE_TIMEOUT
+        )
+    except FileNotFoundError:
+        logger.warning("⚠️ ffprobe not found, skipping duration check")
+        return None, False
+    except subprocess.TimeoutExpired:
+        return f"ffprobe timed out after {FFPROBE_TIMEOUT}s", False
+    
+    if probe.returncode != 0:
+        return f"ffprobe could not read it ({probe.stderr.decode(errors='replace').strip()})", False
+    
+    try:
+        duration = float(orjson.loads(probe.stdout)['format']['duration'])
+    except (ValueError, KeyError, TypeError):
+        logger.warning("⚠️ ffprobe reported no usable duration, skipping duration check")
+        return None, False
+    
+    if duration > MAX_VIDEO_DURATION:
+        return f"duration {duration:.0f}s is over the {MAX_VIDEO_DURATION}s limit", True
+    
+    return None, False
+
+def reconcile_uploaded(youtube, known_ids):
+    """
+    Collect TikTok IDs of videos already on the YouTube channel
+    Reads the tag left by upload_to_youtube from upload descriptions, newest first,
+    and stops at the first upload already in known_ids
+    """
+    logger.info("Reconciling upload history with YouTube...")
+    
+    channels = youtube.channels().list(part='contentDetails', mine=True).execute()
+    if not channels.get('items'):
+        return set()
+    uploads_playlist = channels['items'][0]['contentDetails']['relatedPlaylists']['uploads']
+    
+    tiktok_ids = set()
+    request = youtube.playlistItems().list(
+        part='snippet',
+        playlistId=uploads_playlist,
+        maxResults=50
+    )
+    while request is not None:
+        response = request.execute()
+        for item in response.get('items', []):
+            found = TIKTOK_ID_PATTERN.findall(item['snippet'].get('description', ''))
+            if any(tiktok_id in known_ids for tiktok_id in found):
+                # Everything older was already in the local history
+                return tiktok_ids
+            tiktok_ids.update(found)
+        request = youtube.playlistItems().list_next(request, response)
+    
+    return tiktok_ids
+
+def upload_to_youtube(youtube, video_file, title, description, tiktok_id):
     """Upload video to YouTube"""
-    print(f"Uploading {video_file} to YouTube...")
+    logger.info(f"Uploading {video_file} to YouTube...")
     
     # Limit title to 100 characters (YouTube limit)
     title = title[:97] + "..." if len(title) > 100 else title
@@ -146,7 +462,7 @@ def upload_to_youtube(youtube, video_file, title, description):
     body = {
         'snippet': {
             'title': title,
-            'description': description + "\n\n📱 Share and subscribe\n#Shorts",
+            'description': description + "\n\n📱 Share and subscribe\n#Shorts\n\n" + TIKTOK_ID_TAG.format(tiktok_id),
             'tags': ['TikTok', 'shorts', TIKTOK_USERNAME],
             'categoryId': '22'  # People & Blogs
         },
@@ -156,7 +472,12 @@ def upload_to_youtube(youtube, video_file, title, description):
         }
     }
     
-    media = MediaFileUpload(video_file, chunksize=-1, resumable=True)
+    media = MediaFileUpload(
+        video_file,
+        chunksize=UPLOAD_CHUNKSIZE,
+        resumable=True,
+        mimetype='video/mp4'
+    )
     
     request = youtube.videos().insert(
         part='snippet,status',
@@ -165,23 +486,44 @@ def upload_to_youtube(youtube, video_file, title, description):
     )
     
     response = None
+    retry = 0
     while response is None:
-        status, response = request.next_chunk()
-        if status:
-            print(f"Upload progress: {int(status.progress() * 100)}%")
+        try:
+            status, response = request.next_chunk()
+        except HttpError as e:
+            if e.resp.status not in RETRIABLE_STATUS_CODES or retry >= MAX_UPLOAD_RETRIES:
+                raise
+            error = f"HTTP {e.resp.status}"
+        except RETRIABLE_EXCEPTIONS as e:
+            if retry >= MAX_UPLOAD_RETRIES:
+                raise
+            error = repr(e)
+        else:
+            retry = 0
+            if status:
+                logger.info(f"Upload progress: {int(status.progress() * 100)}%")
+            continue
+        
+        # Exponential backoff with jitter, then resume from the last chunk
+        retry += 1
+        delay = 2 ** retry + random.random()
+        logger.warning(f"⚠️ Upload error ({error}). Retry {retry}/{MAX_UPLOAD_RETRIES} in {delay:.1f}s...")
+        time.sleep(delay)
     
-    print(f"✓ Upload complete! Video ID: {response['id']}")
+    logger.info(f"✓ Upload complete! Video ID: {response['id']}")
     return response['id']
 
-def main(upload_all=False):
+def main(upload_all=False, refresh_list=REFRESH_VIDEO_LIST):
     """
     Main automation function
     upload_all=True: Upload ALL videos at once
     upload_all=False: Upload one video per run (for daily automation)
+    refresh_list=True: Ignore the cached TikTok video list and fetch it again
+                       (defaults to the REFRESH_VIDEO_LIST=1 env var)
     """
-    print(f"\n{'='*60}")
-    print(f"TikTok to YouTube Uploader - {datetime.now()}")
-    print(f"{'='*60}\n")
+    logger.info(f"{'='*60}")
+    logger.info(f"TikTok to YouTube Uploader - {datetime.now()}")
+    logger.info(f"{'='*60}")
     
     # Setup
     setup_directories()
@@ -189,109 +531,195 @@ def main(upload_all=False):
     # Load upload history
     history = load_uploaded_history()
     current_index = history.get('current_index', 0)
-    uploaded_ids = history.get('uploaded_ids', [])
+    uploaded_ids = history['uploaded_ids']
     
     # Get all TikTok videos
-    all_videos = get_all_tiktok_videos()
+    all_videos = get_all_tiktok_videos(current_index, refresh=refresh_list)
     
     if not all_videos:
-        print("No videos found or error fetching videos.")
+        logger.info("No videos found or error fetching videos.")
         return
     
+    # Re-find our position by id in case a full re-scrape dropped deleted videos
+    last_id = history.get('last_id')
+    if last_id is not None:
+        position = next((i for i, v in enumerate(all_videos) if v['id'] == last_id), None)
+        if position is not None and position + 1 != current_index:
+            logger.info(f"Video list changed, resuming after {last_id} at {position + 1} (was {current_index})")
+            current_index = history['current_index'] = position + 1
+            save_uploaded_history(history)
+    
     # Check if we've uploaded all videos
     if current_index >= len(all_videos):
-        print(f"All {len(all_videos)} videos have been uploaded!")
+        logger.info(f"All {len(all_videos)} videos have been uploaded!")
         return
     
     # Authenticate YouTube once
     youtube = get_youtube_service()
     
+    # The channel is authoritative: record uploads missing from the local history
+    try:
+        missing_ids = reconcile_uploaded(youtube, uploaded_ids) - uploaded_ids
+        for video_id in missing_ids:
+            append_uploaded(video_id)
+        uploaded_ids |= missing_ids
+        if missing_ids:
+            logger.info(f"Recovered {len(missing_ids)} uploads missing from local history")
+    except (HttpError, httplib2.HttpLib2Error, TransportError, OSError) as e:
+        # Optional step: network trouble here shouldn't block the uploads
+        logger.warning(f"⚠️ Could not reconcile with YouTube, using local history only: {e}")
+    
+    # Only videos still waiting for upload keep their files, so retries skip the download
+    existing_files = cleanup_uploaded_videos(uploaded_ids)
+    
     # Determine how many videos to upload
     if upload_all:
         videos_to_process = all_videos[current_index:]
-        print(f"\n🚀 BULK UPLOAD MODE: Uploading {len(videos_to_process)} videos")
-        print("This may take a while...\n")
+        logger.info(f"🚀 BULK UPLOAD MODE: Uploading {len(videos_to_process)} videos")
+        logger.info("This may take a while...")
     else:
         videos_to_process = [all_videos[current_index]]
-        print(f"📤 SINGLE UPLOAD MODE: Uploading 1 video")
+        logger.info(f"📤 SINGLE UPLOAD MODE: Uploading 1 video")
     
     # Upload videos
     successful_uploads = 0
     failed_uploads = 0
     
-    for idx, video_to_upload in enumerate(videos_to_process):
-        actual_index = current_index + idx
-        
-        print(f"\n{'─'*60}")
-        print(f"Progress: {actual_index + 1}/{len(all_videos)}")
-        print(f"Video: {video_to_upload['title']}")
-        print(f"{'─'*60}")
-        
-        # Check if already uploaded (safety check)
-        if video_to_upload['id'] in uploaded_ids:
-            print(f"⚠️ Already uploaded. Skipping.")
-            history['current_index'] = actual_index + 1
-            save_uploaded_history(history)
-            continue
-        
-        # Download video
-        video_file = download_tiktok_video(video_to_upload)
-        
-        if not video_file:
-            print("❌ Failed to download. Skipping.")
-            failed_uploads += 1
-            continue
+    # Download in a background thread while the main thread uploads.
+    # Each pending id is handed over once, even if the listing repeats it
+    pending_videos = []
+    pending_ids = set()
+    for video in videos_to_process:
+        if video['id'] not in uploaded_ids and video['id'] not in pending_ids:
+            pending_ids.add(video['id'])
+            pending_videos.append(video)
+    handed_over_ids = set()
+    ready_queue = queue.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+    
+    stop_event = threading.Event()
+    
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(download_producer, pending_videos, existing_files, ready_queue, stop_event)
         
-        # Upload to YouTube
         try:
-            youtube_id = upload_to_youtube(
-                youtube,
-                video_file,
-                video_to_upload['title'],
-                video_to_upload.get('description', 'Check out my other content!')
-            )
-            
-            # Update history
-            uploaded_ids.append(video_to_upload['id'])
-            history['uploaded_ids'] = uploaded_ids
-            history['current_index'] = actual_index + 1
-            save_uploaded_history(history)
-            
-            successful_uploads += 1
-            print(f"✅ Successfully uploaded! ({successful_uploads} done)")
-            
-            # Optional: Delete downloaded file to save space
-            # os.remove(video_file)
-            
-            # Add small delay to avoid rate limits
-            if upload_all and idx < len(videos_to_process) - 1:
-                print("⏳ Waiting 10 seconds before next upload...")
-                time.sleep(10)
-            
-        except Exception as e:
-            print(f"❌ Error uploading: {e}")
-            failed_uploads += 1
-            continue
+            for idx, video_to_upload in enumerate(videos_to_process):
+                actual_index = current_index + idx
+                
+                logger.info(f"{'─'*60}")
+                logger.info(f"Progress: {actual_index + 1}/{len(all_videos)}")
+                logger.info(f"Video: {video_to_upload['title']}")
+                logger.info(f"{'─'*60}")
+                
+                # Check if already uploaded (safety check)
+                if video_to_upload['id'] in uploaded_ids:
+                    logger.warning(f"⚠️ Already uploaded. Skipping.")
+                    history['current_index'] = actual_index + 1
+                    history['last_id'] = video_to_upload['id']
+                    save_uploaded_history(history)
+                    continue
+                
+                # Repeated id in the listing: the downloader only fetched it once
+                if video_to_upload['id'] in handed_over_ids:
+                    logger.warning(f"⚠️ Duplicate of an earlier video in the listing. Skipping.")
+                    history['current_index'] = actual_index + 1
+                    history['last_id'] = video_to_upload['id']
+                    save_uploaded_history(history)
+                    continue
+                
+                # Wait for the downloader to hand over this video
+                item = ready_queue.get()
+                if item is None:
+                    logger.error("❌ Downloader stopped unexpectedly.")
+                    failed_uploads += len(pending_ids - handed_over_ids)
+                    break
+                video_info, video_file = item
+                handed_over_ids.add(video_info['id'])
+                
+                if video_info['id'] != video_to_upload['id']:
+                    # Never upload one video's file under another video's title
+                    logger.error(f"❌ Downloader handed over {video_info['id']} instead of {video_to_upload['id']}. Stopping.")
+                    failed_uploads += len(pending_ids - handed_over_ids) + 1
+                    break
+                
+                if not video_file:
+                    logger.error("❌ Failed to download. Skipping.")
+                    failed_uploads += 1
+                    continue
+                
+                # Fail fast on files YouTube would reject after a full upload
+                reason, permanent = validate_video_file(video_file)
+                if reason:
+                    logger.error(f"❌ Not uploading: {reason}. Skipping.")
+                    os.remove(video_file)
+                    failed_uploads += 1
+                    if permanent or record_failure(history, video_to_upload['id']):
+                        # Retrying can't help, move past this video
+                        logger.error("❌ Giving up on this video.")
+                        history['failures'].pop(video_to_upload['id'], None)
+                        history['current_index'] = actual_index + 1
+                        history['last_id'] = video_to_upload['id']
+                    save_uploaded_history(history)
+                    continue
+                
+                # Upload to YouTube
+                try:
+                    youtube_id = upload_to_youtube(
+                        youtube,
+                        video_file,
+                        video_to_upload['title'],
+                        video_to_upload.get('description', 'Check out my other content!'),
+                        video_to_upload['id']
+                    )
+                    
+                    # Update history
+                    uploaded_ids.add(video_to_upload['id'])
+                    append_uploaded(video_to_upload['id'])
+                    history['failures'].pop(video_to_upload['id'], None)
+                    history['current_index'] = actual_index + 1
+                    history['last_id'] = video_to_upload['id']
+                    save_uploaded_history(history)
+                    
+                    successful_uploads += 1
+                    logger.info(f"✅ Successfully uploaded! ({successful_uploads} done)")
+                    
+                    # Delete downloaded file to save space (failed uploads keep theirs)
+                    os.remove(video_file)
+                
+                except Exception as e:
+                    logger.error(f"❌ Error uploading: {e}")
+                    failed_uploads += 1
+                    
+                    # Back off only when YouTube says we're rate limited;
+                    # the download workers keep fetching the next videos meanwhile
+                    if isinstance(e, HttpError) and e.resp.status == 429:
+                        logger.warning("⏳ Rate limited. Waiting 10 seconds before next upload...")
+                        time.sleep(10)
+                    continue
+        finally:
+            # Unblock the downloader however the loop ends (errors, Ctrl-C)
+            stop_event.set()
     
     # Final summary
-    print(f"\n{'='*60}")
-    print(f"📊 UPLOAD SUMMARY")
-    print(f"{'='*60}")
-    print(f"✅ Successful: {successful_uploads}")
-    print(f"❌ Failed: {failed_uploads}")
-    print(f"📈 Total Progress: {history['current_index']}/{len(all_videos)}")
+    logger.info(f"{'='*60}")
+    logger.info(f"📊 UPLOAD SUMMARY")
+    logger.info(f"{'='*60}")
+    logger.info(f"✅ Successful: {successful_uploads}")
+    logger.info(f"❌ Failed: {failed_uploads}")
+    logger.info(f"📈 Total Progress: {history['current_index']}/{len(all_videos)}")
     
     if history['current_index'] >= len(all_videos):
-        print(f"\n🎉 ALL VIDEOS UPLOADED! ({len(all_videos)} total)")
+        logger.info(f"🎉 ALL VIDEOS UPLOADED! ({len(all_videos)} total)")
     else:
         remaining = len(all_videos) - history['current_index']
-        print(f"\n📋 Remaining: {remaining} videos")
+        logger.info(f"📋 Remaining: {remaining} videos")
         if not upload_all:
-            print("Run again to upload the next video.")
+            logger.info("Run again to upload the next video.")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', stream=sys.stdout)
+    
     # Install required packages first:
-    # pip install yt-dlp google-api-python-client google-auth
+    # pip install yt-dlp google-api-python-client google-auth google-auth-httplib2 orjson
     
     # Choose mode:
     
@@ -310,6 +738,6 @@ if __name__ == "__main__":
     #     try:
     #         main(upload_all=False)
     #     except Exception as e:
-    #         print(f"Error: {e}")
-    #     print("\nWaiting 24 hours for next upload...")
+    #         logger.error(f"Error: {e}")
+    #     logger.info("Waiting 24 hours for next upload...")
     #     time.sleep(24 * 60 * 60)